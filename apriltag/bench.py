@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+'''Sweep camera and AprilTag detector settings to find a good config.
+
+Tuning --res, --dec, --threads and --fps in test1.py by hand is tedious,
+so this tries every combination and reports detection FPS, end-to-end
+latency, CPU use and detection rate for each, then saves the best one
+as JSON.
+
+It can run against a set of recorded frames, so no camera is needed:
+
+    ./bench.py --record frames/ --res 640x480 --count 300   # on the Pi
+    ./bench.py --frames frames/                             # anywhere
+
+--frames takes anything framesource.py can replay: a directory of images
+or a raw .y/.yuv file (whose frame size is then given by --res).
+
+or live against the camera, which also sweeps still1 vs vid1:
+
+    ./bench.py --live
+'''
+
+import json
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+import robotpy_apriltag as at
+
+from framesource import open_source, PiCameraSource
+
+
+RESOLUTIONS = ['320x240', '640x480', '1280x960', '1640x1232']
+DECIMATIONS = [1, 2, 3, 4]
+THREADS = [1, 2, 4]
+MODES = ['still1', 'vid1']
+
+
+def parse_res(text):
+    return tuple(int(x) for x in text.split('x'))
+
+
+def make_detector(dec, threads, bits=0):
+    det = at.AprilTagDetector()
+    det.addFamily('tag16h5', bitsCorrected=bits)
+    cfg = det.getConfig()
+    cfg.quadDecimate = dec
+    cfg.numThreads = threads
+    det.setConfig(cfg)
+    return det
+
+
+#-----------------------------------------------
+# recorded frames
+
+def load_frames(spec, size):
+    '''Load every frame from a recorded source (see framesource.py).'''
+    return [img for img, _ in open_source(spec, size=size)]
+
+
+def scaler(src_size, size):
+    '''Return a function that nearest-neighbour resizes a frame, or None
+    if the size already matches.  The index arrays are built once here
+    so the per-frame cost is a single fancy-index copy.'''
+    (sw, sh), (w, h) = src_size, size
+    if (sw, sh) == (w, h):
+        return None
+    rows = (np.arange(h) * sh // h)[:, None]
+    cols = (np.arange(w) * sw // w)[None, :]
+    return lambda img: np.ascontiguousarray(img[rows, cols])
+
+
+def run_recorded(frames, size, dec, threads, bits):
+    sh, sw = frames[0].shape[:2]
+    if size[0] > sw or size[1] > sh:
+        return None     # can't upscale meaningfully
+
+    resize = scaler((sw, sh), size)
+    det = make_detector(dec, threads, bits)
+
+    latencies = []
+    hits = 0
+    cpu0 = time.process_time()
+    start = time.perf_counter()
+    for frame in frames:
+        # There's no capture to time with recorded frames, so "latency"
+        # here is just processing time: the resize plus detect().
+        t0 = time.perf_counter()
+        img = resize(frame) if resize else frame
+        tags = det.detect(img)
+        latencies.append(time.perf_counter() - t0)
+        hits += bool(tags)
+
+    wall = time.perf_counter() - start
+    return summarize(len(frames), hits, wall, time.process_time() - cpu0, latencies)
+
+
+#-----------------------------------------------
+# live camera
+
+def run_live(mode, size, dec, threads, bits, fps, count):
+    src = PiCameraSource(size, fps=fps, mode=mode)
+    src.start()
+    try:
+        det = make_detector(dec, threads, bits)
+        for _ in range(5):  # let exposure settle
+            src.read()
+
+        latencies = []
+        hits = 0
+        cpu0 = time.process_time()
+        start = time.perf_counter()
+        for _ in range(count):
+            img, ts = src.read()
+            tags = det.detect(img)
+            latencies.append((time.monotonic_ns() - ts) / 1e9)
+            hits += bool(tags)
+
+        wall = time.perf_counter() - start
+    finally:
+        src.close()
+
+    return summarize(count, hits, wall, time.process_time() - cpu0, latencies)
+
+
+def record(path, size, fps, count):
+    '''Record Y-plane frames from the camera, either as a raw .y file
+    or as a directory of .npy files.'''
+    out = Path(path)
+    src = PiCameraSource(size, fps=fps)
+    src.start()
+    try:
+        if out.suffix == '.y':
+            with open(out, 'wb') as f:
+                for _ in range(count):
+                    img, _ = src.read()
+                    f.write(img.tobytes())
+        else:
+            out.mkdir(parents=True, exist_ok=True)
+            for i in range(count):
+                img, _ = src.read()
+                np.save(out / f'{i:05d}.npy', img)
+    finally:
+        src.close()
+    print('recorded %d frames (%dx%d) to %s' % ((count,) + src.size + (out,)))
+
+
+#-----------------------------------------------
+
+def summarize(frames, hits, wall, cpu, latencies):
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else math.nan
+    return dict(
+        fps=frames / wall,
+        lat_ms=pct(0.5) * 1000,
+        lat99_ms=pct(0.99) * 1000,
+        cpu=100 * cpu / wall,       # percent of one core, can exceed 100
+        rate=hits / frames,
+        )
+
+
+def recommend(results, tolerance):
+    '''Pick the fastest config whose detection rate is within tolerance
+    of the best one seen, breaking ties on latency.'''
+    best_rate = max(r['rate'] for r in results)
+    ok = [r for r in results if r['rate'] >= best_rate - tolerance]
+    return max(ok, key=lambda r: (round(r['fps']), -r['lat_ms']))
+
+
+def main():
+    if args.record:
+        record(args.record, parse_res(args.res), args.fps, args.count)
+        return
+
+    sizes = [parse_res(x) for x in args.sweep_res]
+
+    if args.live:
+        modes = args.modes
+    else:
+        if not args.frames:
+            raise SystemExit('need --frames DIR or --live')
+        frames = load_frames(args.frames, parse_res(args.res))
+        modes = ['recorded']
+        sh, sw = frames[0].shape[:2]
+        print(f'loaded {len(frames)} frames ({sw}x{sh})')
+        skipped = [size for size in sizes if size[0] > sw or size[1] > sh]
+        if skipped:
+            print('skipping sizes larger than the recording: '
+                + ', '.join('%dx%d' % size for size in skipped))
+
+    # with recorded frames we can only time the processing, not the
+    # end-to-end latency from the sensor
+    lat = 'lat ms' if args.live else 'proc ms'
+    print(f'{"mode":>8} {"res":>9} dec thr {"fps":>6} {lat:>7} {"p99":>6} {"cpu %":>6} {"det %":>6}')
+    results = []
+    for mode in modes:
+        for size in sizes:
+            for dec in args.decs:
+                for threads in args.threads:
+                    if args.live:
+                        r = run_live(mode, size, dec, threads, args.bits, args.fps, args.count)
+                    else:
+                        r = run_recorded(frames, size, dec, threads, args.bits)
+                    if r is None:
+                        continue
+
+                    r.update(mode=mode, res='%dx%d' % size, dec=dec, threads=threads)
+                    results.append(r)
+                    print(f'{mode:>8} {r["res"]:>9} {dec:3} {threads:3} {r["fps"]:6.1f} '
+                        f'{r["lat_ms"]:7.1f} {r["lat99_ms"]:6.1f} {r["cpu"]:6.0f} {r["rate"] * 100:6.1f}')
+
+    if not results:
+        raise SystemExit('nothing to benchmark (frames smaller than every --sweep-res?)')
+
+    best = recommend(results, args.tolerance)
+    config = dict(res=best['res'], dec=best['dec'], threads=best['threads'], bits=args.bits)
+    if args.live:
+        config.update(mode=best['mode'], fps=args.fps)
+    print(f'\nrecommended: {config}')
+
+    with open(args.output, 'w') as f:
+        json.dump(dict(recommended=config, results=results), f, indent=2)
+    print(f'saved to {args.output}')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', help='recorded frames: image directory or raw .y/.yuv file')
+    parser.add_argument('--live', action='store_true', help='benchmark the camera directly')
+    parser.add_argument('--record', metavar='DIR', help='record frames for later benchmarking')
+    parser.add_argument('--res', default='640x480', help='resolution for --record, or of raw --frames files')
+    parser.add_argument('--count', type=int, default=200, help='frames to record or capture per combination')
+    parser.add_argument('--fps', type=float, default=60.0)
+    parser.add_argument('--bits', type=int, default=0, help='bitsCorrected for tag16h5')
+    parser.add_argument('--sweep-res', nargs='+', default=RESOLUTIONS)
+    parser.add_argument('--decs', type=int, nargs='+', default=DECIMATIONS)
+    parser.add_argument('--threads', type=int, nargs='+', default=THREADS)
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--tolerance', type=float, default=0.05,
+        help='allowed drop in detection rate vs the best config')
+    parser.add_argument('-o', '--output', default='bench.json')
+
+    args = parser.parse_args()
+
+    main()
@@ -0,0 +1,301 @@
+'''Pluggable frame sources for the AprilTag scripts.
+
+Everything here hands out greyscale (Y plane) frames as 2D uint8 numpy
+arrays, which is what the detector wants.  Besides the Pi camera there
+are sources that replay recorded frames, so the detect/stream pipeline
+can be run and profiled on a Linux box with no camera attached:
+
+    src = open_source('picam', size=(320, 240), fps=60)
+    src = open_source('run1.y', size=(640, 480))        # raw Y planes
+    src = open_source('run1.yuv', size=(640, 480))      # raw YUV420
+    src = open_source('frames/', fps=60, realtime=True)
+
+    src.start()
+    while (frame := src.read()) is not None:
+        img, ts = frame
+        ...
+    src.close()
+
+With realtime=True the recorded sources pace themselves at fps and,
+like a real camera, drop any frames the consumer was too slow to take.
+The count is in src.dropped, which makes dropped frames reproducible.
+'''
+
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+class FrameSource:
+    '''Base class.  Subclasses implement _next() and set size.'''
+
+    size = None         # (width, height)
+    streams = False     # True if start() can feed an MJPEG output
+
+    def __init__(self, fps=None, realtime=False, loop=False):
+        self.fps = fps
+        self.realtime = realtime and bool(fps)
+        self.loop = loop
+        self.count = 0
+        self.dropped = 0
+
+    def start(self, output=None):
+        self._start = time.monotonic_ns()
+
+    def stop(self):
+        pass
+
+    def close(self):
+        '''Stop and release anything held open.'''
+        self.stop()
+
+    def read(self):
+        '''Return (img, timestamp_ns) or None at end of input.  The
+        timestamp is on the time.monotonic_ns() clock.'''
+        if not self.realtime:
+            img = self._next()
+            if img is None:
+                return None
+            self.count += 1
+            return img, time.monotonic_ns()
+
+        # Work out which frame "the camera" is on right now, skipping
+        # any we missed, then wait for the next one if we're early.
+        period = 1e9 / self.fps
+        due = int((time.monotonic_ns() - self._start) / period)
+        if due > self.count:
+            self.dropped += self._skip(due - self.count)
+            self.count = due
+        ts = self._start + int(self.count * period)
+        delay = ts - time.monotonic_ns()
+        if delay > 0:
+            time.sleep(delay / 1e9)
+
+        img = self._next()
+        if img is None:
+            return None
+        self.count += 1
+        return img, ts
+
+    def _next(self):
+        raise NotImplementedError
+
+    def _skip(self, n):
+        '''Discard n frames, returning how many were actually skipped.'''
+        for i in range(n):
+            if self._next() is None:
+                return i
+        return n
+
+    def __iter__(self):
+        self.start()
+        try:
+            while (frame := self.read()) is not None:
+                yield frame
+        finally:
+            self.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class IndexedSource(FrameSource):
+    '''Shared code for sources that can fetch frame i directly.'''
+
+    def __init__(self, nframes, **kwargs):
+        super().__init__(**kwargs)
+        self.nframes = nframes
+        self._pos = 0
+
+    def __len__(self):
+        return self.nframes
+
+    def _next(self):
+        if self._pos >= self.nframes:
+            if not self.loop or not self.nframes:
+                return None
+            self._pos = 0
+        img = self._frame(self._pos)
+        self._pos += 1
+        return img
+
+    def _skip(self, n):
+        if self.loop:
+            self._pos = (self._pos + n) % self.nframes
+            return n
+        n = min(n, self.nframes - self._pos)
+        self._pos += n
+        return n
+
+    def _frame(self, i):
+        raise NotImplementedError
+
+
+class RawFileSource(IndexedSource):
+    '''Memory-mapped file of back-to-back raw frames, either bare Y planes
+    ('y') or YUV420 ('yuv420', of which we only look at the Y plane).
+    Frames are handed out as views into the map, so nothing is copied.'''
+
+    def __init__(self, path, size, fmt='y', **kwargs):
+        w, h = size
+        stride = w * h * 3 // 2 if fmt == 'yuv420' else w * h
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+        nframes = len(self._map) // stride
+        self._map = self._map[:nframes * stride].reshape(nframes, stride)
+        super().__init__(nframes, **kwargs)
+        self.size = size
+
+    def _frame(self, i):
+        w, h = self.size
+        return self._map[i, :w * h].reshape(h, w)
+
+
+class ImageDirSource(IndexedSource):
+    '''Directory of images, loaded up front so disk reads don't show up
+    in the timing.  Handles .npy and .pgm directly; other formats such
+    as .png and .jpg need Pillow.'''
+
+    def __init__(self, path, **kwargs):
+        files = sorted(f for f in Path(path).iterdir() if f.is_file())
+        self._frames = [img for img in map(load_image, files) if img is not None]
+        if not self._frames:
+            raise ValueError(f'no usable images in {path}')
+        super().__init__(len(self._frames), **kwargs)
+        h, w = self._frames[0].shape
+        self.size = (w, h)
+
+    def _frame(self, i):
+        return self._frames[i]
+
+
+def load_image(path):
+    '''Load one image file as a greyscale uint8 array, or None if it
+    isn't something we recognize.'''
+    ext = path.suffix.lower()
+    if ext == '.npy':
+        img = np.load(path)
+        if img.ndim == 3:
+            img = img[:, :, 0]
+    elif ext == '.pgm':
+        img = read_pgm(path)
+    elif ext in ('.png', '.jpg', '.jpeg', '.bmp'):
+        from PIL import Image
+        img = np.asarray(Image.open(path).convert('L'))
+    else:
+        return None
+    return np.ascontiguousarray(img, dtype=np.uint8)
+
+
+def read_pgm(path):
+    '''Minimal reader for 8-bit binary (P5) PGM files.'''
+    data = path.read_bytes()
+    fields = []
+    pos = 0
+    while len(fields) < 4:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b'#':
+            pos = data.index(b'\n', pos)
+            continue
+        end = pos
+        while not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[pos:end])
+        pos = end
+    magic, w, h, maxval = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+    if magic != b'P5' or maxval > 255:
+        raise ValueError(f'{path}: only 8-bit P5 PGM is supported')
+    return np.frombuffer(data, np.uint8, w * h, pos + 1).reshape(h, w)
+
+
+class PiCameraSource(FrameSource):
+    '''The Pi camera via picamera2, capturing from the lores YUV420 stream.
+    mode is 'still1' or 'vid1', matching the configs in test1.py.'''
+
+    streams = True
+
+    def __init__(self, size, fps=60.0, mode='vid1', **kwargs):
+        # only import these here so the other sources work without them
+        import picamera2
+        from libcamera import Transform
+
+        super().__init__(fps=fps, **kwargs)
+        self.realtime = False   # the camera paces itself
+        self.cam = cam = picamera2.Picamera2()
+
+        if mode == 'still1':
+            cfg = cam.create_still_configuration(
+                main=dict(size=size, format='RGB888'),
+                lores=dict(size=size, format='YUV420'),
+                controls=dict(FrameRate=fps), # FrameDurationLimits=(1, 5000)),
+                queue=True,
+                buffer_count=2,
+                transform=Transform(hflip=1, vflip=1),
+                )
+        else:
+            cfg = cam.create_video_configuration(
+                main=dict(size=size),
+                lores=dict(size=size, format='YUV420'),
+                controls=dict(FrameRate=fps), # FrameDurationLimits=(1, 5000)),
+                queue=False,
+                buffer_count=1,
+                transform=Transform(hflip=1, vflip=1),
+                )
+
+        cam.align_configuration(cfg)
+        cam.configure(cfg)
+        # alignment may have changed the size slightly
+        self.size = tuple(cfg['lores']['size'])
+
+    def start(self, output=None):
+        super().start()
+        if output is not None:
+            from picamera2.encoders import JpegEncoder
+            from picamera2.outputs import FileOutput
+            self.cam.start_recording(JpegEncoder(), FileOutput(output))
+        else:
+            self.cam.start()
+
+    def stop(self):
+        self.cam.stop()
+
+    def close(self):
+        # picamera2 keeps a reference to every open camera, so without
+        # this the next PiCameraSource would find the camera busy
+        self.cam.stop()
+        self.cam.close()
+
+    def read(self):
+        # SensorTimestamp is on the same clock as time.monotonic_ns()
+        req = self.cam.capture_request()
+        try:
+            arr = req.make_array('lores')
+            ts = req.get_metadata().get('SensorTimestamp') or time.monotonic_ns()
+        finally:
+            req.release()
+        self.count += 1
+        # the lores array is padded out to the row stride (and the U/V
+        # planes follow the Y one), so cut it down to just the image
+        w, h = self.size
+        return np.ascontiguousarray(arr[:h, :w]), ts
+
+
+def open_source(spec, size=None, fps=None, realtime=False, loop=False, mode='vid1'):
+    '''Pick a source based on spec: 'picam', a directory of images, or a
+    raw file (.yuv/.yuv420 for YUV420, anything else is bare Y planes).'''
+    if spec == 'picam':
+        return PiCameraSource(size, fps=fps or 60.0, mode=mode)
+
+    opts = dict(fps=fps, realtime=realtime, loop=loop)
+    path = Path(spec)
+    if path.is_dir():
+        return ImageDirSource(path, **opts)
+
+    if size is None:
+        raise ValueError(f'need a frame size for raw file {spec}')
+    fmt = 'yuv420' if path.suffix.lower() in ('.yuv', '.yuv420') else 'y'
+    return RawFileSource(path, size, fmt, **opts)
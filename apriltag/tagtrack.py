@@ -0,0 +1,212 @@
+'''Per-tag tracking and outlier rejection for AprilTag detections.
+
+Taking the single best tag each frame means one bad frame gives a bad
+pose, which is why test1.py runs tag16h5 with bitsCorrected=0.  The
+TagTracker here keeps a short history per tag ID and only reports a
+tag once it has been seen consistently, so error correction can go
+back on (for more range) without false detections getting through:
+
+    tracker = TagTracker()
+    while ...:
+        for track in tracker.update(det.detect(img), time.time()):
+            print(track.id, track.confidence, track.center)
+
+Detections are rejected if their decision margin is too low (more so
+when bits were corrected), if they are too small, if their size jumps
+too much compared to the track, or if they move further than the tag
+plausibly could since the last frame.  Until a track is confirmed, a
+detection that doesn't fit just restarts it, so one false hit can't
+lock out the real tag; after that, rejected detections that agree with
+each other can take the track over.  Corners of accepted detections
+are smoothed across frames.
+'''
+
+import collections
+
+import numpy as np
+
+
+def corners_of(det):
+    '''Return a detection's corners as a 4x2 array.'''
+    return np.array([(p.x, p.y) for p in map(det.getCorner, range(4))])
+
+
+def quad_area(c):
+    '''Area of a quad given as a 4x2 array (shoelace formula).'''
+    x, y = c[:, 0], c[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+class Track:
+    '''One tag ID's history.  Read id, corners, center, margin and
+    confidence; the rest is internal to TagTracker.'''
+
+    def __init__(self, tid, history):
+        self.id = tid
+        self.hits = collections.deque(maxlen=history)   # True/False per frame
+        self.margins = collections.deque(maxlen=history)  # 0 for misses
+        self.corners = None
+        self.center = None
+        self.velocity = np.zeros(2)     # px/s of the center
+        self.area = 0.0
+        self.margin = 0.0
+        self.time = 0.0                 # of the last accepted detection
+        self.misses = 0                 # consecutive frames without one
+        self.confidence = 0.0
+
+    def predict(self, t):
+        return self.center + self.velocity * (t - self.time)
+
+    def __repr__(self):
+        return (f'Track(id={self.id}, conf={self.confidence:.2f}, '
+            f'center=({self.center[0]:.0f},{self.center[1]:.0f}), margin={self.margin:.0f})')
+
+
+class TagTracker:
+    '''Filters raw detections into confidence-scored tracks.
+
+    history     frames of history kept per tag
+    minMargin   minimum decision margin for a clean (hamming 0) decode
+    bitMargin   extra margin required per corrected bit
+    goodMargin  margin at which a detection counts as fully trusted
+    minArea     minimum tag area in pixels
+    maxGrowth   max fractional change in area vs the track
+    maxSpeed    max plausible tag motion in pixels/second
+    smoothing   weight of the newest corners (1 = no smoothing)
+    minHits     hits in the history before a track is reported
+    maxMisses   consecutive missed frames before a track is dropped
+    '''
+
+    def __init__(self, history=8, minMargin=20, bitMargin=30, goodMargin=80,
+            minArea=64, maxGrowth=0.5, maxSpeed=2000, smoothing=0.5,
+            minHits=3, maxMisses=5):
+        self.history = history
+        self.minMargin = minMargin
+        self.bitMargin = bitMargin
+        self.goodMargin = goodMargin
+        self.minArea = minArea
+        self.maxGrowth = maxGrowth
+        self.maxSpeed = maxSpeed
+        self.smoothing = smoothing
+        self.minHits = minHits
+        self.maxMisses = maxMisses
+        self.tracks = {}
+        self.candidates = {}    # tracks that may replace one in tracks
+        self.rejected = collections.Counter()   # by reason, for tuning
+
+    def update(self, detections, t):
+        '''Feed in one frame's detections taken at time t (seconds),
+        returning the confirmed tracks, most confident first.'''
+        # More than one detection of an ID in a frame means at least one
+        # is false, so keep only the most plausible of each.
+        best = {}
+        for det in detections:
+            tid = det.getId()
+            best[tid] = self.pick(tid, best[tid], det, t) if tid in best else det
+
+        for tid, det in best.items():
+            self.observe(tid, det, t)
+
+        for tid, track in list(self.tracks.items()):
+            if tid not in best:
+                self.miss(track)
+            if track.misses > self.maxMisses:
+                del self.tracks[tid]
+                self.candidates.pop(tid, None)
+                continue
+            hits = sum(track.hits)
+            mean = sum(track.margins) / hits if hits else 0
+            track.confidence = (hits / self.history) * min(1.0, mean / self.goodMargin)
+
+        confirmed = [tr for tr in self.tracks.values()
+            if self.confirmed(tr) and tr.misses == 0]
+        confirmed.sort(key=lambda tr: -tr.confidence)
+        return confirmed
+
+    def confirmed(self, track):
+        return sum(track.hits) >= self.minHits
+
+    def pick(self, tid, a, b, t):
+        '''Of two detections of one ID, return the one nearest where its
+        track says it should be, or the stronger if there's no track.'''
+        track = self.tracks.get(tid)
+        if track is None or track.corners is None:
+            return max(a, b, key=lambda det: det.getDecisionMargin())
+        p = track.predict(t)
+        return min(a, b, key=lambda det: np.linalg.norm(corners_of(det).mean(axis=0) - p))
+
+    def reject(self, track, reason):
+        self.rejected[reason] += 1
+        self.miss(track)
+
+    def miss(self, track):
+        track.hits.append(False)
+        track.margins.append(0.0)
+        track.misses += 1
+
+    def check(self, track, corners, area, t):
+        '''Return why a detection doesn't fit the track, or None if it does.'''
+        if track.corners is None:
+            return None
+        if abs(area / track.area - 1) > self.maxGrowth:
+            return 'size'
+        slack = 0.25 * np.sqrt(track.area)  # allow for corner jitter
+        center = corners.mean(axis=0)
+        if np.linalg.norm(center - track.predict(t)) > self.maxSpeed * (t - track.time) + slack:
+            return 'motion'
+        return None
+
+    def observe(self, tid, det, t):
+        track = self.tracks.get(tid)
+        if track is None:
+            track = self.tracks[tid] = Track(tid, self.history)
+
+        margin = det.getDecisionMargin()
+        if margin < self.minMargin + self.bitMargin * det.getHamming():
+            return self.reject(track, 'margin')
+
+        corners = corners_of(det)
+        area = quad_area(corners)
+        if area < self.minArea:
+            return self.reject(track, 'size')
+
+        reason = self.check(track, corners, area, t)
+        if reason is None:
+            self.candidates.pop(tid, None)
+            return self.accept(track, corners, margin, t)
+
+        if not self.confirmed(track):
+            # Nothing is established yet, so this detection is as likely
+            # to be the real tag as whatever started the track: start over.
+            self.rejected['restart'] += 1
+            track = self.tracks[tid] = Track(tid, self.history)
+            return self.accept(track, corners, margin, t)
+
+        self.reject(track, reason)
+
+        # If the tag really did jump, or the track was the false one, the
+        # rejected detections will agree with each other, so follow them
+        # in a candidate track that takes over once it's confirmed.
+        cand = self.candidates.get(tid)
+        if cand is None or self.check(cand, corners, area, t):
+            cand = self.candidates[tid] = Track(tid, self.history)
+        self.accept(cand, corners, margin, t)
+        if self.confirmed(cand):
+            self.tracks[tid] = self.candidates.pop(tid)
+
+    def accept(self, track, corners, margin, t):
+        if track.corners is not None:
+            dt = t - track.time
+            a = self.smoothing
+            corners = a * corners + (1 - a) * track.corners
+            if dt > 0:
+                track.velocity = (corners.mean(axis=0) - track.center) / dt
+
+        track.corners = corners
+        track.center = corners.mean(axis=0)
+        track.area = quad_area(corners)
+        track.margin = margin
+        track.time = t
+        track.misses = 0
+        track.hits.append(True)
+        track.margins.append(margin)
@@ -10,10 +10,8 @@ import time
 
 import robotpy_apriltag as at
 
-from libcamera import Transform
-import picamera2
-from picamera2.encoders import JpegEncoder
-from picamera2.outputs import FileOutput
+from framesource import open_source
+from tagtrack import TagTracker
 
 degrees = lambda rad: rad * 180 / math.pi
 
@@ -97,35 +95,14 @@ class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
 
 
 def main():
-    cam = picamera2.Picamera2()
-
-    still1 = cam.create_still_configuration(
-        main=dict(size=SIZE, format='RGB888'),
-        lores=dict(size=SIZE, format='YUV420'),
-        controls=dict(FrameRate=args.fps), # FrameDurationLimits=(1, 5000)),
-        queue=True,
-        buffer_count=2,
-        transform=Transform(hflip=1, vflip=1),
-        )
-
-    vid1 = cam.create_video_configuration(
-        main=dict(size=SIZE),
-        lores=dict(size=SIZE, format='YUV420'),
-        controls=dict(FrameRate=args.fps), # FrameDurationLimits=(1, 5000)),
-        queue=False,
-        buffer_count=1,
-        transform=Transform(hflip=1, vflip=1),
-        )
-
-    cam_config = vid1
-    cam.align_configuration(cam_config)
-    # print('Cam config:\n%s' % '\n'.join(f'{x:>15} = {y}' for x, y in cam_config.items()))
-    cam.configure(cam_config)
+    src = open_source(args.source, size=SIZE, fps=args.fps,
+        realtime=args.realtime, loop=args.loop, mode=args.mode)
 
     global output
-    output = StreamingOutput()
-    cam.start_recording(JpegEncoder(), FileOutput(output))
-    # cam.start()
+    output = None
+    if src.streams:
+        output = StreamingOutput()
+    src.start(output)
 
     class Server(threading.Thread):
         def run(self):
@@ -137,13 +114,17 @@ def main():
         def close(self):
             self.server.shutdown()
 
-    server = Server(daemon=True)
-    server.start()
+    # the MJPEG stream comes from the camera's encoder, so there's
+    # nothing to serve when replaying recorded frames
+    server = None
+    if output is not None:
+        server = Server(daemon=True)
+        server.start()
     # time.sleep(0.1)
 
     try:
         det = at.AprilTagDetector()
-        det.addFamily('tag16h5', bitsCorrected=0)
+        det.addFamily('tag16h5', bitsCorrected=args.bits)
         cfg = det.getConfig()
         cfg.quadDecimate = args.dec
         cfg.numThreads = args.threads
@@ -160,11 +141,15 @@ def main():
         missed = 0
         fps = 0
         found = False
-        height = SIZE[0] * 2 // 3
+        tracker = None if args.raw else TagTracker()
         while now - start < args.time:
-            arr = cam.capture_array('lores')
-            img = arr[:height,:]
+            frame = src.read()
+            if frame is None:
+                break
+            img, ts = frame
             tags = det.detect(img)
+            if tracker is not None:
+                tags = tracker.update(tags, ts / 1e9)
             count += 1
             now = time.time()
             if now - reported > 1:
@@ -182,17 +167,28 @@ def main():
 
             if found:
                 missed = 0
-                x = sorted(tags, key=lambda x: -x.getDecisionMargin())[0]
-                c = x.getCenter()
-                tid = x.getId()
-                margin = x.getDecisionMargin()
-                print(f'\r{fps:3.0f} FPS: margin={margin:2.0f} @{c.x:3.0f},{c.y:3.0f} id={tid:2}  ' % tags, end='')
+                if tracker is None:
+                    x = sorted(tags, key=lambda x: -x.getDecisionMargin())[0]
+                    c = x.getCenter()
+                    tid = x.getId()
+                    margin = x.getDecisionMargin()
+                    print(f'\r{fps:3.0f} FPS: margin={margin:2.0f} @{c.x:3.0f},{c.y:3.0f} id={tid:2}  ', end='')
+                else:
+                    x = tags[0]     # most confident
+                    cx, cy = x.center
+                    print(f'\r{fps:3.0f} FPS: margin={x.margin:2.0f} @{cx:3.0f},{cy:3.0f} id={x.id:2} '
+                        f'conf={x.confidence:.2f} tracks={len(tags)}  ', end='')
 
     finally:
         print()
-        cam.stop()
-        server.close()
-        server.join()
+        if tracker is not None and tracker.rejected:
+            print('rejected:', ', '.join(f'{k}={v}' for k, v in tracker.rejected.items()))
+        src.close()
+        if src.dropped:
+            print(f'dropped {src.dropped} of {src.count} frames')
+        if server is not None:
+            server.close()
+            server.join()
 
 
 if __name__ == '__main__':
@@ -205,6 +201,16 @@ if __name__ == '__main__':
     parser.add_argument('--threads', type=int, default=4)
     parser.add_argument('--fps', type=float, default=60.0)
     parser.add_argument('--time', type=float, default=10.0)
+    parser.add_argument('--source', default='picam',
+        help="'picam', a directory of images, or a raw .y/.yuv file (sized by --res)")
+    parser.add_argument('--mode', default='vid1', choices=['still1', 'vid1'])
+    parser.add_argument('--realtime', action='store_true',
+        help='replay recorded frames at --fps, dropping any we are too slow for')
+    parser.add_argument('--loop', action='store_true', help='loop recorded frames')
+    parser.add_argument('--bits', type=int, default=0,
+        help='bitsCorrected for tag16h5; try 1 or 2 for more range with tracking on')
+    parser.add_argument('--raw', action='store_true',
+        help='show raw best-margin detections instead of filtered tracks')
 
     args = parser.parse_args()
     SIZE = tuple(int(x) for x in args.res.split('x'))
@@ -1,5 +1,6 @@
 
 from wpimath.geometry import Transform3d, Translation3d, Rotation3d, Pose3d
+from pyfrc.physics import motor_cfgs
 from pyfrc.physics.units import units
 
 
@@ -11,6 +12,19 @@ kRightMotor2 = 4
 
 kMotors = (kLeftMotor1, kLeftMotor2, kRightMotor1, kRightMotor2)
 
+# Drivetrain, used by the physics.py TankModel and by pathtool.py.
+# Change these parameters to fit your robot!
+kBumperWidth = 3.25 * units.inch
+kDriveMotor = motor_cfgs.MOTOR_CFG_CIM
+kDriveMass = 110 * units.lbs
+kDriveGearing = 10.71
+kDriveMotorsPerSide = 2
+kDriveWheelbase = 22 * units.inch       # i.e. track width, left to right
+kDriveWidth = 23 * units.inch + kBumperWidth * 2
+kDriveLength = 32 * units.inch + kBumperWidth * 2
+kWheelDiameter = 6 * units.inch
+kWheelFriction = 1.1                    # coefficient, for traction limits
+
 # from FRC-2023 PhotonVision-Testing branch
 kLeftEncoder1 = 0
 kLeftEncoder2 = 1
@@ -41,6 +55,21 @@ cam1Rot = Rotation3d(0, cam1Pitch, 0)
 # transform camera pose to robot pose
 robotToCam1 = Transform3d(cam1Trans, cam1Rot)
 
+# All the cameras on the robot.  Each gets its own polling thread and
+# result queue (see vision.py), so add a row here for each new camera
+# with its PhotonVision name and its robot-to-camera mount transform.
+CAMERAS = [
+    dict(name=cam1Name, robotToCam=robotToCam1),
+    # dict(name='rear', robotToCam=Transform3d(
+    #     Translation3d(-0.3, 0, 0.2), Rotation3d(0, 0, (180 * units.degree).m_as(units.rad)))),
+    ]
+
+# Pose estimates from targets more ambiguous than this are discarded.
+# PhotonVision suggests anything above 0.2 is likely to be wrong.
+maxAmbiguity = 0.2
+# Ignore estimates older than this (seconds) when combining.
+maxEstimateAge = 0.3
+
 # Apriltags
 tagsize = (6.0 * units.inch).to(units.m)
 
@@ -0,0 +1,106 @@
+'''Shared model of the field's AprilTags.
+
+Loading the layout and pulling tag poses out one at a time is slow-ish
+and was being done separately by robot.py and physics.py, so this loads
+it once (see get()) and precomputes everything in contiguous numpy
+arrays, indexed the same as ids:
+
+    pos         (N, 3) tag positions
+    rot         (N, 3, 3) tag rotation matrices
+    transforms  (N, 4, 4) tag-to-field homogeneous transforms
+    inverses    (N, 4, 4) field-to-tag transforms
+    normals     (N, 3) unit vector each tag faces (its +X axis)
+
+Nothing here depends on wpilib itself, so a coprocessor can use it too.
+'''
+
+import functools
+import math
+
+import numpy as np
+import robotpy_apriltag as at
+from wpimath.geometry import Pose2d, Pose3d
+
+
+FIELD = at.AprilTagField.k2023ChargedUp
+
+
+def rotation_matrix(rotation):
+    '''Return a Rotation3d as a 3x3 numpy rotation matrix.'''
+    q = rotation.getQuaternion()
+    w, x, y, z = q.W(), q.X(), q.Y(), q.Z()
+    return np.array([
+        [1 - 2*(y*y + z*z),     2*(x*y - z*w),     2*(x*z + y*w)],
+        [    2*(x*y + z*w), 1 - 2*(x*x + z*z),     2*(y*z - x*w)],
+        [    2*(x*z - y*w),     2*(y*z + x*w), 1 - 2*(x*x + y*y)],
+        ])
+
+
+class FieldModel:
+    def __init__(self, layout):
+        self.layout = layout
+        tags = sorted(layout.getTags(), key=lambda t: t.ID)
+        self.ids = np.array([t.ID for t in tags])
+        self.poses = {t.ID: t.pose for t in tags}
+        self.index = {t.ID: i for i, t in enumerate(tags)}
+
+        n = len(tags)
+        self.pos = np.array([(t.pose.x, t.pose.y, t.pose.z) for t in tags]).reshape(n, 3)
+        self.rot = np.array([rotation_matrix(t.pose.rotation()) for t in tags]).reshape(n, 3, 3)
+
+        self.transforms = np.zeros((n, 4, 4))
+        self.transforms[:, :3, :3] = self.rot
+        self.transforms[:, :3, 3] = self.pos
+        self.transforms[:, 3, 3] = 1
+
+        # inverse of a rigid transform is [R^T, -R^T p]
+        rt = self.rot.transpose(0, 2, 1)
+        self.inverses = np.zeros((n, 4, 4))
+        self.inverses[:, :3, :3] = rt
+        self.inverses[:, :3, 3] = -np.einsum('nij,nj->ni', rt, self.pos)
+        self.inverses[:, 3, 3] = 1
+
+        self.normals = np.ascontiguousarray(self.rot[:, :, 0])
+
+    def pose(self, tid):
+        '''Return the Pose3d of a tag, or None if there's no such tag.'''
+        return self.poses.get(tid)
+
+    def in_tag_frames(self, point):
+        '''Return an (N, 3) array of where a field point is relative to
+        each tag (x out of the tag's face, y left, z up).'''
+        p = np.append(np.asarray(point, dtype=float), 1.0)
+        return (self.inverses @ p)[:, :3]
+
+    def visible(self, pose, fov=math.radians(70), maxRange=math.inf, robotToCam=None):
+        '''Return the IDs of tags a camera could see, nearest first.
+
+        pose is the robot's Pose2d or Pose3d, and robotToCam the camera's
+        mount Transform3d (if None the camera is at the robot's origin
+        facing forward).  A tag counts as visible if it's within half the
+        fov of the camera's axis, within maxRange metres, and facing the
+        camera.  Occlusion is ignored.
+        '''
+        if isinstance(pose, Pose2d):
+            pose = Pose3d(pose)
+        if robotToCam is not None:
+            pose = pose.transformBy(robotToCam)
+
+        cam = np.array((pose.x, pose.y, pose.z))
+        forward = rotation_matrix(pose.rotation())[:, 0]
+
+        offsets = self.pos - cam
+        dist = np.linalg.norm(offsets, axis=1)
+        ok = (
+            (offsets @ forward >= dist * math.cos(fov / 2))
+            & (np.einsum('ij,ij->i', self.normals, offsets) < 0)
+            & (dist <= maxRange)
+            )
+        idx = np.flatnonzero(ok)
+        return [int(self.ids[i]) for i in idx[np.argsort(dist[idx])]]
+
+
+@functools.lru_cache(maxsize=None)
+def get(field=FIELD):
+    '''Return the FieldModel for a field, loading it only the first time.'''
+    return FieldModel(at.loadAprilTagLayoutField(field))
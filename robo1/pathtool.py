@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+'''Check PathWeaver trajectories against the drivetrain and re-time them.
+
+PathWeaver generates trajectories with fixed velocity and acceleration
+limits (see PathWeaver/pathweaver.json), which know nothing about what
+our drivetrain can actually do.  This loads each path's waypoints and
+generated trajectory, checks them against limits worked out from the
+same parameters physics.py gives the TankModel (constants.kDrive*), and
+re-times the trajectory as fast as those limits allow:
+
+    py pathtool.py                  # check every path
+    py pathtool.py Path1 --write    # also write Path1.retimed.wpilib.json
+
+The drivetrain model is the TankModel's, V = kv * v + ka * a + Vintercept,
+solved at --voltage (less than 12 V, to leave some headroom for battery
+sag and feedback), and limited by wheel traction, which is shared
+between cornering and speeding up or slowing down.  On a curve of
+curvature k the outer wheel goes (and accelerates) (1 + k * trackwidth / 2)
+times faster than the robot's center, which caps things further.
+'''
+
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+from pyfrc.physics.units import units
+
+import constants as C
+
+
+ROOT = Path(__file__).resolve().parent.parent
+PATHS = ROOT / 'PathWeaver' / 'Paths'
+OUTPUT = ROOT / 'paths' / 'output'
+
+# PathWeaver puts the origin at the top left (y negative) whereas the
+# exported trajectories are in field coordinates, so y is offset by this.
+FIELD_WIDTH = 8.0137    # meters, 2023 Charged Up
+G = 9.81
+
+
+class Limits:
+    '''Drivetrain limits in SI units, derived as in TankModel.theory().'''
+
+    def __init__(self, voltage=10.0, vintercept=1.3):
+        motor = C.kDriveMotor
+        diameter = C.kWheelDiameter.m_as(units.m)
+        nominal = motor.nominalVoltage.m_as(units.volt)
+
+        # top speed and acceleration at nominal voltage
+        vfree = motor.freeSpeed.m_as(units.cpm) / 60 * math.pi * diameter / C.kDriveGearing
+        astall = (2.0 * C.kDriveMotorsPerSide * motor.stallTorque.m_as(units.N_m)
+            * C.kDriveGearing / (diameter * C.kDriveMass.m_as(units.kg)))
+        self.kv = nominal / vfree
+        self.ka = nominal / astall
+        self.voltage = voltage - vintercept
+
+        self.vmax = self.voltage / self.kv
+        self.traction = C.kWheelFriction * G
+        self.trackwidth = C.kDriveWheelbase.m_as(units.m)
+
+    def grip(self, v, k):
+        '''Traction left for speeding up or slowing down while cornering
+        at speed v on curvature k.  Grip is one total shared between the
+        two (the friction circle), so a tight fast curve leaves little.'''
+        lateral = v * v * abs(k)
+        return math.sqrt(max(0.0, self.traction ** 2 - lateral ** 2))
+
+    def accel(self, v, k=0.0):
+        '''Max acceleration available at speed v on curvature k.  On a
+        curve the outer wheel is both faster and accelerating harder than
+        the robot's center, so that's the one the motors limit.'''
+        scale = 1 + abs(k) * self.trackwidth / 2
+        motor = (self.voltage - self.kv * v * scale) / (self.ka * scale)
+        return min(self.grip(v, k), max(0.0, motor))
+
+    def decel(self, v, k=0.0):
+        '''Max deceleration at speed v on curvature k (the motors help
+        when braking).'''
+        scale = 1 + abs(k) * self.trackwidth / 2
+        motor = (self.voltage + self.kv * v * scale) / (self.ka * scale)
+        return min(self.grip(v, k), motor)
+
+    def speed(self, curvature):
+        '''Max speed of the robot's center for each curvature.'''
+        k = np.abs(curvature)
+        wheel = self.vmax / (1 + k * self.trackwidth / 2)
+        with np.errstate(divide='ignore'):
+            lateral = np.sqrt(self.traction / k)
+        return np.minimum(wheel, lateral)
+
+    def __str__(self):
+        return (f'vmax={self.vmax:.2f} m/s, accel={self.accel(0):.2f} m/s^2 from rest, '
+            f'traction={self.traction:.1f} m/s^2, trackwidth={self.trackwidth:.3f} m')
+
+
+class Trajectory:
+    '''A WPILib trajectory, as parallel numpy arrays.'''
+
+    def __init__(self, states):
+        self.t = np.array([s['time'] for s in states])
+        self.v = np.array([s['velocity'] for s in states])
+        self.a = np.array([s['acceleration'] for s in states])
+        self.k = np.array([s['curvature'] for s in states])
+        self.x = np.array([s['pose']['translation']['x'] for s in states])
+        self.y = np.array([s['pose']['translation']['y'] for s in states])
+        self.heading = np.array([s['pose']['rotation']['radians'] for s in states])
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        states = [dict(
+            acceleration=a, curvature=k, time=t, velocity=v,
+            pose=dict(rotation=dict(radians=h), translation=dict(x=x, y=y)),
+            ) for t, v, a, k, x, y, h in zip(*(arr.tolist() for arr in
+                (self.t, self.v, self.a, self.k, self.x, self.y, self.heading)))]
+        with open(path, 'w') as f:
+            json.dump(states, f, indent=0)
+
+    def distances(self):
+        '''Length of each segment between consecutive states.'''
+        return np.hypot(np.diff(self.x), np.diff(self.y))
+
+    def copy(self):
+        new = object.__new__(Trajectory)
+        new.__dict__ = {k: v.copy() for k, v in self.__dict__.items()}
+        return new
+
+
+def load_waypoints(path):
+    '''Load a PathWeaver path file as a list of dicts.'''
+    lines = path.read_text().splitlines()
+    keys = lines[0].split(',')
+    return [dict(zip(keys, line.split(','))) for line in lines[1:] if line.strip()]
+
+
+def check(traj, limits):
+    '''Return a list of problems with the trajectory vs the limits.'''
+    problems = []
+    speed = np.abs(traj.v)
+
+    over = speed > limits.speed(traj.k) + 1e-6
+    if over.any():
+        i = np.argmax(speed - limits.speed(traj.k))
+        problems.append(f'{over.sum()} states too fast for their curvature '
+            f'(worst {speed[i]:.2f} m/s at t={traj.t[i]:.2f}s, k={traj.k[i]:.2f})')
+
+    accel = np.array([limits.accel(v, k) for v, k in zip(speed, traj.k)])
+    decel = np.array([limits.decel(v, k) for v, k in zip(speed, traj.k)])
+    # acceleration sign is relative to travel direction for reversed paths
+    a = traj.a * np.sign(traj.v + (traj.v == 0))
+    over = (a > accel + 1e-6) | (-a > decel + 1e-6)
+    if over.any():
+        problems.append(f'{over.sum()} states accelerate harder than the drivetrain can')
+
+    return problems
+
+
+def reachable(v, ds, limit, k0, k1):
+    '''Fastest speed reachable from v over a segment of length ds, going
+    from curvature k0 to k1, keeping within limit (limits.accel or decel)
+    at both ends.  Grip drops with speed on a curve, so the limit at the
+    far end depends on the answer; a few rounds is plenty to settle it.'''
+    a = limit(v, k0)
+    for _ in range(4):
+        a = min(a, limit(math.sqrt(v * v + 2 * a * ds), k1))
+    return math.sqrt(v * v + 2 * a * ds)
+
+
+def retime(traj, limits):
+    '''Return a copy of the trajectory with velocities, accelerations and
+    times recomputed to be as fast as the limits allow.
+
+    The usual two passes: forward limiting acceleration, then backward
+    limiting deceleration, each capped by the curvature speed limit.
+    '''
+    ds = traj.distances()
+    cap = limits.speed(traj.k)
+    n = len(cap)
+    reverse = traj.v.min() < 0 and traj.v.max() <= 0
+
+    k = traj.k
+    v = np.empty(n)
+    v[0] = min(abs(traj.v[0]), cap[0])
+    for i in range(1, n):
+        v[i] = min(cap[i], reachable(v[i - 1], ds[i - 1], limits.accel, k[i - 1], k[i]))
+
+    v[-1] = min(v[-1], abs(traj.v[-1]))
+    for i in range(n - 2, -1, -1):
+        v[i] = min(v[i], reachable(v[i + 1], ds[i], limits.decel, k[i + 1], k[i]))
+
+    # constant acceleration across each segment
+    vsum = v[:-1] + v[1:]
+    dt = np.divide(2 * ds, vsum, out=np.zeros_like(ds), where=vsum > 0)
+    a = np.divide(np.diff(v), dt, out=np.zeros_like(ds), where=dt > 0)
+
+    new = traj.copy()
+    new.t = np.concatenate(([0.0], np.cumsum(dt)))
+    new.v = -v if reverse else v
+    # WPILib stores the acceleration applied *from* each state onwards
+    new.a = np.append(a, 0.0)
+    if reverse:
+        new.a = -new.a
+    return new
+
+
+def find_paths(names):
+    '''Yield (name, waypoint file or None, trajectory file).'''
+    if not names:
+        names = sorted(p.name for p in PATHS.iterdir())
+    for name in names:
+        path = Path(name)
+        if path.suffix == '.json':
+            yield path.name.split('.')[0], None, path
+        else:
+            yield name, PATHS / name, OUTPUT / f'{name}.wpilib.json'
+
+
+def main():
+    limits = Limits(voltage=args.voltage)
+    print(limits)
+    print()
+    print(f'{"path":>12} {"states":>6} {"length":>7} {"max k":>6} {"time":>6} {"retimed":>7}')
+
+    for name, wpfile, trajfile in find_paths(args.paths):
+        if not trajfile.exists():
+            print(f'{name:>12} no trajectory ({trajfile}), generate it in PathWeaver')
+            continue
+
+        traj = Trajectory.load(trajfile)
+        problems = check(traj, limits)
+
+        if wpfile is not None and wpfile.exists():
+            points = load_waypoints(wpfile)
+            first, last = points[0], points[-1]
+            start = (float(first['X']), float(first['Y']) + FIELD_WIDTH)
+            end = (float(last['X']), float(last['Y']) + FIELD_WIDTH)
+            if (math.dist(start, (traj.x[0], traj.y[0])) > 0.05
+                    or math.dist(end, (traj.x[-1], traj.y[-1])) > 0.05):
+                problems.append('trajectory does not match the waypoints, regenerate it')
+
+        new = retime(traj, limits)
+        length = traj.distances().sum()
+        print(f'{name:>12} {len(traj.t):6} {length:6.2f}m {np.abs(traj.k).max():6.2f} '
+            f'{traj.t[-1]:5.2f}s {new.t[-1]:6.2f}s')
+        for problem in problems:
+            print(f'{"":>12} - {problem}')
+
+        if args.write:
+            out = trajfile.with_name(f'{name}.retimed.wpilib.json')
+            new.save(out)
+            print(f'{"":>12} wrote {out}')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='*',
+        help='PathWeaver path names or .wpilib.json files (default all paths)')
+    parser.add_argument('--voltage', type=float, default=10.0,
+        help='motor voltage to plan for, below 12 to leave headroom')
+    parser.add_argument('-w', '--write', action='store_true',
+        help='write <name>.retimed.wpilib.json beside each trajectory')
+
+    args = parser.parse_args()
+
+    main()
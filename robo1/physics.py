@@ -13,10 +13,9 @@ from wpimath.geometry import Transform3d as T3D
 import wpilib.simulation
 
 import photonvision as pv
-import robotpy_apriltag as at
 
 from pyfrc.physics.core import PhysicsInterface
-from pyfrc.physics import motor_cfgs, tankmodel, drivetrains
+from pyfrc.physics import tankmodel, drivetrains
 from pyfrc.physics.units import units
 
 import constants as C
@@ -24,10 +23,11 @@ import constants as C
 USE_TANK_MODEL = True
 
 
+# Common settings for each simulated camera.  The name and cameraToRobot
+# (transform to move from the camera's mount position to robot) come
+# from C.CAMERAS.
 SIMCAM = dict(
-    camName = C.cam1Name, # Name of the PhotonVision camera to create.
     camDiagFOV = 170,     # Diagonal Field of View of the camera used.
-    cameraToRobot = C.robotToCam1.inverse(),# Transform to move from the camera's mount position to robot.
     maxLEDRange = 9000,   # docs say use 9000 on cameras without LEDs
     cameraResWidth = 640, # Width of your camera's image sensor in pixels
     cameraResHeight = 480,# Height of your camera's image sensor in pixels
@@ -50,16 +50,20 @@ class PhysicsEngine:
 
         self.physics = physics_controller
 
-        self.cam1 = pv.SimVisionSystem(**SIMCAM)
+        self.cams = [
+            pv.SimVisionSystem(**SIMCAM,
+                camName=cam['name'],
+                cameraToRobot=cam['robotToCam'].inverse())
+            for cam in C.CAMERAS
+            ]
 
-        layout = at.loadAprilTagLayoutField(at.AprilTagField.k2023ChargedUp)
-        for i in range(1, 9):
-            pose = layout.getTagPose(i)
+        for i, pose in robot.field.poses.items():
             tag = self.physics.field.getObject(f'tag{i}')
             tag.setPose(pose.toPose2d())
 
             target = pv.SimVisionTarget(pose, C.tagsize.m, C.tagsize.m, i)
-            self.cam1.addSimVisionTarget(target)
+            for cam in self.cams:
+                cam.addSimVisionTarget(target)
             print(i, pose)
 
         # Motors
@@ -81,19 +85,17 @@ class PhysicsEngine:
 
         self.position = 0
 
-        # Change these parameters to fit your robot!
-        bumper_width = 3.25 * units.inch
-
+        # Drivetrain parameters are in constants.py, shared with pathtool.py
         if USE_TANK_MODEL:
             self.drivetrain = tankmodel.TankModel.theory(
-                motor_cfgs.MOTOR_CFG_CIM,           # motor configuration
-                110 * units.lbs,                    # robot mass
-                10.71,                              # drivetrain gear ratio
-                2,                                  # motors per side
-                22 * units.inch,                    # robot wheelbase
-                23 * units.inch + bumper_width * 2, # robot width
-                32 * units.inch + bumper_width * 2, # robot length
-                6 * units.inch,                     # wheel diameter
+                C.kDriveMotor,          # motor configuration
+                C.kDriveMass,           # robot mass
+                C.kDriveGearing,        # drivetrain gear ratio
+                C.kDriveMotorsPerSide,  # motors per side
+                C.kDriveWheelbase,      # robot wheelbase
+                C.kDriveWidth,          # robot width
+                C.kDriveLength,         # robot length
+                C.kWheelDiameter,       # wheel diameter
             )
         else:
             # not well tested and doesn't seem to implement momentum
@@ -101,7 +103,7 @@ class PhysicsEngine:
             # has the same behaviour in terms of inversion of one side
             # relative to the real robot, maybe
             self.drivetrain = drivetrains.FourMotorDrivetrain(
-                x_wheelbase = 22 * units.inch,
+                x_wheelbase = C.kDriveWheelbase,
                 speed = 2 * units.meter_per_second,
                 deadzone = drivetrains.linear_deadzone(0.2)
                 )
@@ -135,7 +137,9 @@ class PhysicsEngine:
             speeds = self.drivetrain.calculate(l1, l2, r1, r2)
             pose = self.physics.drive(speeds, tm_diff)
 
-        self.cam1.processFrame(self.physics.get_pose())
+        pose = self.physics.get_pose()
+        for cam in self.cams:
+            cam.processFrame(pose)
 
         # pt = f'\tl={l1:.1f} r={r1:.1f} x={pose.x:4.1f} y={pose.y:4.1f} rot={pose.rotation().degrees():.0f}'
         # if pt != self._prevp and now - self._prevt > 0.5:
@@ -18,9 +18,10 @@ from pyfrc.physics.units import units
 # tests/sim to run faster if they don't require this.
 import ctre
 import rev
-import photonvision as pv
-import robotpy_apriltag as at
 
+import field
+import stress
+import vision
 from constants import * # original code used this... get rid of it
 import constants as C   # this is the better way... less namespace pollution
 
@@ -31,6 +32,7 @@ PREFS = wpilib.Preferences
 
 DRIVE = 'curvature'
 BREAK = False
+STRESS = None   # stress test options, see stress.py
 
 
 # In simulation, for some reason we currently have to negate the
@@ -127,27 +129,17 @@ class MyRobot(wpilib.TimedRobot):
 
 
     def setupVision(self):
-        # shared with physics... TODO: make util modules for such things
-        layout = at.loadAprilTagLayoutField(at.AprilTagField.k2023ChargedUp)
+        # loaded once and shared with physics
+        self.field = field.get()
 
-        self.cam1 = pv.PhotonCamera(C.cam1Name)
-        self.cam1.setVersionCheckEnabled(False)
-
-        # Python doesn't have ArrayLists, so pybind makes us provide the last param as such.
-        self.poseEstimator = pv.RobotPoseEstimator(
-            layout,
-            pv.PoseStrategy.CLOSEST_TO_REFERENCE_POSE,
-            [(self.cam1, C.robotToCam1)],
-        )
-
-        # for i in range(1, 9):
-        #     pose = layout.getTagPose(i)
-            # tag.setPose(pose.toPose2d())
+        # one polling thread per camera in C.CAMERAS, merged by the combiner
+        self.poseEstimator = vision.setup(self.field, C.CAMERAS)
 
 
     def getEstimatedGlobalPose(self, prevEstimate: Pose3d):
-        self.poseEstimator.setReferencePose(Pose3d(pose=prevEstimate.toPose2d()))
-        return self.poseEstimator.update()
+        '''Return (pose, latency in ms), or None if no camera has
+        seen a tag recently.'''
+        return self.poseEstimator.update(Pose3d(pose=prevEstimate.toPose2d()))
 
 
     def robotInit(self):
@@ -190,6 +182,9 @@ class MyRobot(wpilib.TimedRobot):
         # S/N 32363BD has X forward, other one has X left
         PREFS.initInt('rio_rotation', 0)
 
+        if STRESS is not None and self.sim:
+            stress.install(self, STRESS)
+
         # smartTab = Shuffleboard.getTab("Foobar")
         # smartTab.add(title='DIO 5', defaultValue=self.dio4)
         # smartTab.add(title="Potentiometer", defaultValue=self.elevatorPot)
@@ -225,14 +220,17 @@ class MyRobot(wpilib.TimedRobot):
         #     warnings.simplefilter('ignore')
         if True:
             try:
-                pose, latency = self.getEstimatedGlobalPose(self.globalPose)
-                if True: #pose != self.globalPose:
+                estimate = self.getEstimatedGlobalPose(self.globalPose)
+                if estimate is not None:
+                    pose, latency = estimate
                     self.globalPose = pose
                     DASH.putString('pose', f'{pose.x:.2f},{pose.y:.2f} {pose.rotation().z_degrees:.0f}')
                     DASH.putNumber('latency', latency)
             except Exception as ex:
                 print(ex)
 
+            DASH.putNumber('vision errors', sum(w.errors for w in self.poseEstimator.workers))
+
 
     def robotPeriodic(self):
         self.updateDashboard()
@@ -371,4 +369,11 @@ if __name__ == "__main__":
         BREAK = True
         sys.argv.remove('--break')
 
+    # --stress or --stress=cpu=8,vision=0.5,... (see stress.py)
+    for arg in sys.argv:
+        if arg == '--stress' or arg.startswith('--stress='):
+            STRESS = arg.partition('=')[2]
+            sys.argv.remove(arg)
+            break
+
     wpilib.run(MyRobot)
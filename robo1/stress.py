@@ -0,0 +1,221 @@
+'''Match-load stress testing for MyRobot under the simulator.
+
+    py robot.py sim --stress
+    py robot.py sim --stress=cpu=8,vision=0.5,dash=3,drop=0.02
+
+This wraps methods on the running robot to inject trouble each loop:
+
+    cpu      ms of busy-wait CPU load per loop (default 5)
+    vision   chance getEstimatedGlobalPose() raises (default 0.2)
+    dash     ms of sleep in each updateDashboard(), like slow NT (default 2)
+    drop     chance per loop the sticks drop out (default 0.01)
+    droplen  loops a dropout lasts (default 25)
+    seed     random seed, so runs can be repeated (default 1)
+    safety   1 turns on motor safety in teleop, which sim normally has
+             off, so its trips can be counted; 0 leaves it alone (default 1)
+    report   seconds between reports (default 5)
+
+and measures the loop period, how long each loop's work took, loops
+that overran the period (each one trips the TimedRobot watchdog) and
+motor safety trips, printing a report every few seconds and at exit.
+Headroom is how much of the 20 ms is left at the 99th percentile, so
+a regression shows up as that number shrinking.
+
+A loop is timed from the first of our periodic methods the TimedRobot
+calls to the end of pyfrc's _simulationPeriodic, which runs after the
+SmartDashboard/LiveWindow/Shuffleboard updates and the physics, so
+those count too.
+'''
+
+import atexit
+import collections
+import random
+import statistics
+import time
+import types
+
+
+DEFAULTS = dict(cpu=5.0, vision=0.2, dash=2.0, drop=0.01, droplen=25,
+    seed=1, safety=1, report=5.0)
+
+PERIODICS = ('robotPeriodic', 'disabledPeriodic', 'autonomousPeriodic',
+    'teleopPeriodic', 'testPeriodic')
+
+# pyfrc's physics hook, the last thing in each loop
+SIMPERIODIC = '_simulationPeriodic'
+
+
+def defined_in_python(robot, name):
+    '''True if robot's class overrides name in Python.  Wrapping one that
+    only the C++ base defines would have the base call find our wrapper
+    again through pybind's override lookup and recurse.'''
+    func = getattr(robot, name, None)
+    return isinstance(getattr(func, '__func__', None), types.FunctionType)
+
+
+def parse(spec):
+    '''Parse "cpu=8,vision=0.5" into a config dict over DEFAULTS.'''
+    cfg = dict(DEFAULTS)
+    for item in filter(None, (spec or '').split(',')):
+        key, _, value = item.partition('=')
+        if key not in cfg:
+            raise ValueError(f'unknown stress option {key!r}, expected one of {", ".join(cfg)}')
+        cfg[key] = type(cfg[key])(value)
+    return cfg
+
+
+class DropoutStick:
+    '''Stands in for a joystick, acting disconnected while dropped.'''
+
+    def __init__(self, stick):
+        self._stick = stick
+        self.dropped = False
+
+    def isConnected(self):
+        return not self.dropped and self._stick.isConnected()
+
+    def __getattr__(self, name):
+        attr = getattr(self._stick, name)
+        if self.dropped and name.startswith('get'):
+            # a disconnected controller reads as centered with nothing pressed
+            return lambda *args: 0.0
+        return attr
+
+
+class LoopStats:
+    '''Per-loop timings over a fixed window, plus running totals.'''
+
+    def __init__(self, period, window=500):
+        self.period = period
+        self.periods = collections.deque(maxlen=window)
+        self.work = collections.deque(maxlen=window)
+        self.loops = 0
+        self.overruns = 0
+        self.safetyTrips = 0
+        self.visionErrors = 0
+
+    def add(self, period, work):
+        if period is not None:
+            self.periods.append(period)
+        self.work.append(work)
+        self.loops += 1
+        if work > self.period:
+            self.overruns += 1
+
+    def report(self):
+        if len(self.periods) < 2:
+            return 'stress: not enough loops yet'
+        ms = lambda s: s * 1000
+        work = sorted(self.work)
+        p99 = work[int(0.99 * (len(work) - 1))]
+        headroom = self.period - p99
+        return (f'stress: period {ms(statistics.mean(self.periods)):.1f}'
+            f' +/- {ms(statistics.stdev(self.periods)):.2f} ms (max {ms(max(self.periods)):.1f}),'
+            f' work p99 {ms(p99):.1f} ms, headroom {ms(headroom):.1f} ms'
+            f' ({100 * headroom / self.period:.0f}%),'
+            f' overruns {self.overruns}/{self.loops}, safety trips {self.safetyTrips},'
+            f' vision errors {self.visionErrors}')
+
+
+class Stress:
+    def __init__(self, robot, cfg):
+        self.robot = robot
+        self.cfg = cfg
+        self.rand = random.Random(cfg['seed'])
+        self.stats = LoopStats(robot.getPeriod())
+        self.loopStart = None
+        self.lastStart = None
+        self.pendingPeriod = None
+        self.lastReport = time.perf_counter()
+        self.dropLeft = 0
+        self.wasAlive = True
+
+    def install(self):
+        robot = self.robot
+
+        # The TimedRobot calls the mode's periodic first, then
+        # robotPeriodic, then the NT updates and finally the simulation,
+        # so a loop runs from the first of these to the end of the last.
+        self.last = SIMPERIODIC if defined_in_python(robot, SIMPERIODIC) else 'robotPeriodic'
+        for name in PERIODICS + (SIMPERIODIC,):
+            if defined_in_python(robot, name):
+                setattr(robot, name, self.wrapPeriodic(name, getattr(robot, name)))
+
+        getPose = robot.getEstimatedGlobalPose
+        def getEstimatedGlobalPose(prev):
+            if self.rand.random() < self.cfg['vision']:
+                self.stats.visionErrors += 1
+                raise RuntimeError('stress: injected vision failure')
+            return getPose(prev)
+        robot.getEstimatedGlobalPose = getEstimatedGlobalPose
+
+        updateDashboard = robot.updateDashboard
+        def slowDashboard():
+            time.sleep(self.cfg['dash'] / 1000)
+            updateDashboard()
+        robot.updateDashboard = slowDashboard
+
+        # motor safety is off in sim teleop, but we want to count its trips
+        if self.cfg['safety']:
+            teleopInit = robot.teleopInit
+            def teleopInitWithSafety():
+                teleopInit()
+                robot.drive.setSafetyEnabled(True)
+            robot.teleopInit = teleopInitWithSafety
+
+        robot.simStick = DropoutStick(robot.simStick)
+        robot.driveStick = DropoutStick(robot.driveStick)
+
+        atexit.register(lambda: print(self.stats.report()))
+        print(f'stress: {", ".join(f"{k}={v}" for k, v in self.cfg.items())}')
+        if self.cfg['safety']:
+            print('stress: motor safety will be enabled in teleop (unlike a normal sim run)')
+
+    def wrapPeriodic(self, name, func):
+        last = name == self.last
+        def periodic():
+            if self.loopStart is None:
+                self.startLoop()
+            func()
+            if last:
+                self.endLoop()
+        return periodic
+
+    def startLoop(self):
+        now = self.loopStart = time.perf_counter()
+        if self.lastStart is not None:
+            self.pendingPeriod = now - self.lastStart
+        self.lastStart = now
+
+        if self.dropLeft:
+            self.dropLeft -= 1
+        elif self.rand.random() < self.cfg['drop']:
+            self.dropLeft = self.cfg['droplen']
+        dropped = self.dropLeft > 0
+        self.robot.simStick.dropped = self.robot.driveStick.dropped = dropped
+
+        end = now + self.cfg['cpu'] / 1000
+        while time.perf_counter() < end:
+            pass
+
+    def endLoop(self):
+        now = time.perf_counter()
+        self.stats.add(self.pendingPeriod, now - self.loopStart)
+        self.loopStart = None
+
+        drive = self.robot.drive
+        alive = drive.isAlive() or not drive.isSafetyEnabled()
+        if self.wasAlive and not alive:
+            self.stats.safetyTrips += 1
+        self.wasAlive = alive
+
+        if now - self.lastReport >= self.cfg['report']:
+            self.lastReport = now
+            print(self.stats.report())
+
+
+def install(robot, spec):
+    '''Start stress testing robot, with options from a spec string.'''
+    stress = Stress(robot, parse(spec))
+    stress.install()
+    return stress
@@ -0,0 +1,154 @@
+'''Multi-camera AprilTag pose estimation.
+
+Each camera in constants.CAMERAS gets a CameraWorker thread that polls
+PhotonVision for new results, turns each target into a robot pose
+estimate, and pushes it onto that camera's own queue.  The main loop
+then only has to call PoseCombiner.update(), which drains the queues
+and merges whatever is new, so adding cameras doesn't add NT traffic
+or pose math to the 20 ms loop.
+'''
+
+import collections
+import math
+import threading
+
+import wpilib
+from wpimath.geometry import Pose3d, Rotation3d, Translation3d
+
+import photonvision as pv
+
+import constants as C
+
+
+# One pose estimate from a single target.  poses holds the best and
+# (if there is one) alternate solution, and timestamp is FPGA time in
+# seconds of when the frame was captured.
+Estimate = collections.namedtuple('Estimate',
+    'timestamp poses ambiguity distance camera')
+
+
+class CameraWorker(threading.Thread):
+    '''Polls one PhotonCamera in the background.'''
+
+    def __init__(self, name, robotToCam, field, period=0.01, maxlen=20):
+        super().__init__(name=f'vision-{name}', daemon=True)
+        self.cam = pv.PhotonCamera(name)
+        self.cam.setVersionCheckEnabled(False)
+        self.camToRobot = robotToCam.inverse()
+        self.field = field
+        self.period = period
+        # deque append/popleft are atomic, so no extra locking needed
+        self.results = collections.deque(maxlen=maxlen)
+        self.errors = 0
+        self.lastError = None
+        self._done = threading.Event()
+
+    def close(self):
+        self._done.set()
+
+    def run(self):
+        last = None
+        while not self._done.wait(self.period):
+            try:
+                result = self.cam.getLatestResult()
+                ts = result.getTimestamp()
+                if ts == last or not result.hasTargets():
+                    continue
+                last = ts
+
+                for target in result.getTargets():
+                    est = self.estimate(ts, target)
+                    if est is not None:
+                        self.results.append(est)
+
+            except Exception as ex:
+                # don't let one bad frame kill the thread; the count
+                # shows up on the dashboard if it keeps happening
+                self.errors += 1
+                self.lastError = ex
+
+    def estimate(self, ts, target):
+        ambiguity = target.getPoseAmbiguity()
+        if ambiguity > C.maxAmbiguity:
+            return None
+
+        tagPose = self.field.pose(target.getFiducialId())
+        if tagPose is None:
+            return None
+
+        best = target.getBestCameraToTarget()
+        poses = [tagPose.transformBy(best.inverse()).transformBy(self.camToRobot)]
+        if ambiguity > 0:
+            alt = target.getAlternateCameraToTarget()
+            poses.append(tagPose.transformBy(alt.inverse()).transformBy(self.camToRobot))
+
+        distance = best.translation().norm()
+        return Estimate(ts, poses, max(ambiguity, 0), distance, self.name)
+
+
+class PoseCombiner:
+    '''Merges the estimates from several CameraWorkers.
+
+    Only the latest frame from each camera is used, since older ones
+    trail the robot while it moves.  Where a target has two solutions we
+    take the one closer to the reference pose (as
+    PoseStrategy.CLOSEST_TO_REFERENCE_POSE did), then average the
+    targets, weighting each by how unambiguous and how close it was and
+    by how fresh its frame is.
+    '''
+
+    def __init__(self, workers, maxAge=C.maxEstimateAge):
+        self.workers = workers
+        self.maxAge = maxAge
+        self.latest = {}    # camera name: estimates from its newest frame
+
+    def update(self, reference=None):
+        '''Return (pose, latency in ms) or None if nothing is recent.
+        The latency is the weighted age of the estimates used.'''
+        for worker in self.workers:
+            q = worker.results
+            while q:
+                est = q.popleft()
+                frame = self.latest.get(est.camera)
+                if not frame or est.timestamp > frame[0].timestamp:
+                    self.latest[est.camera] = [est]
+                elif est.timestamp == frame[0].timestamp:
+                    frame.append(est)
+
+        now = wpilib.Timer.getFPGATimestamp()
+        recent = [est for frame in self.latest.values() for est in frame
+            if now - est.timestamp < self.maxAge]
+        if not recent:
+            return None
+
+        sw = sx = sy = sz = ssin = scos = sage = 0.0
+        for est in recent:
+            pose = est.poses[0]
+            if reference is not None and len(est.poses) > 1:
+                pose = min(est.poses, key=lambda p: p.translation().distance(reference.translation()))
+
+            # +0.01 so a zero ambiguity doesn't give infinite weight, and
+            # fading out linearly with age so stale frames count for less
+            age = now - est.timestamp
+            w = (1 - age / self.maxAge) / ((est.ambiguity + 0.01) * max(est.distance, 0.1) ** 2)
+            yaw = pose.rotation().z
+            sw += w
+            sx += w * pose.x
+            sy += w * pose.y
+            sz += w * pose.z
+            ssin += w * math.sin(yaw)
+            scos += w * math.cos(yaw)
+            sage += w * age
+
+        pose = Pose3d(Translation3d(sx / sw, sy / sw, sz / sw),
+            Rotation3d(0, 0, math.atan2(ssin, scos)))
+        return pose, sage / sw * 1000
+
+
+def setup(field, cameras=C.CAMERAS):
+    '''Create and start a worker per camera, returning the combiner.
+    field is a field.FieldModel.'''
+    workers = [CameraWorker(cam['name'], cam['robotToCam'], field) for cam in cameras]
+    for worker in workers:
+        worker.start()
+    return PoseCombiner(workers)